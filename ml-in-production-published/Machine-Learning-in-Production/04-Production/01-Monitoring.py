@@ -109,6 +109,14 @@
 
 # COMMAND ----------
 
+# MAGIC %run ../Includes/Drift-Monitor
+
+# COMMAND ----------
+
+# MAGIC %run ../Includes/Synthetic-Data
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ## Kolmogorov-Smirnov Test 
 # MAGIC 
@@ -122,7 +130,7 @@
 # COMMAND ----------
 
 import seaborn as sns
-from scipy.stats import gaussian_kde, truncnorm
+from scipy.stats import gaussian_kde
 import numpy as np
 import matplotlib.pyplot as plt
 import numpy as np
@@ -142,31 +150,48 @@ def plot_distribution(distibution_1, distibution_2):
     sns.kdeplot(distibution_2, shade=True, color="b", label=2)
     plt.legend(loc="upper right", borderaxespad=0)
 
+def plot_binned_distribution(p, q, edges):
+    """
+    Plots the two given distributions from their histograms instead of their raw values
+    The densities are binned KDEs (see `binned_kde` in ../Includes/Drift-Monitor), so the plot takes milliseconds
+    whatever the sample size
+
+    :param p: array, histogram counts of the first distribution
+    :param q: array, histogram counts of the second distribution
+    :param edges: array, bin edges shared by both histograms
+
+    """
+    for counts, color, label in [(p, "g", 1), (q, "b", 2)]:
+        grid, density = binned_kde(counts, edges)
+        plt.plot(grid, density, color=color, label=label)
+        plt.fill_between(grid, density, color=color, alpha=0.25)
+    plt.legend(loc="upper right", borderaxespad=0)
+
 def get_truncated_normal(mean=0, sd=1, low=0.2, upp=0.8, n_size=1000, seed=999):
     """
     Generates truncated normal distribution based on given mean, standard deviation, lower bound, upper bound and sample size 
+    The sample is drawn with `SyntheticData` (see ../Includes/Synthetic-Data), so it only depends on the seed and the sample size
 
     :param mean: float, mean used to create the distribution 
     :param sd: float, standard deviation used to create distribution
     :param low: float, lower bound used to create the distribution 
     :param upp: float, upper bound used to create the distribution 
     :param n_size: integer, desired sample size 
+    :param seed: integer, seed of the generator
 
-    :return distb: rv_continuous 
+    :return distb: array 
     """
-    np.random.seed(seed=seed)
-
-    a = (low-mean) / sd
-    b = (upp-mean) / sd
-    distb = truncnorm(a, b, loc=mean, scale=sd).rvs(n_size, random_state=seed)
+    data = SyntheticData({"value": TruncatedNormal(mean, sd, low, upp)}, seed=seed)
+    distb = data.to_pandas(n_size)["value"].to_numpy()
     return distb
 
-def calculate_ks(distibution_1, distibution_2):
+def calculate_ks(distibution_1, distibution_2, plot=True):
     """
     Helper function that calculated the KS stat and plots the two distributions used in the calculation 
 
     :param distribution_1: rv_continuous
     :param distribution_2: rv_continuous 
+    :param plot: bool, set to False to skip the plot, e.g. in automated jobs
 
     :return p_value: float, resulting p-value from KS calculation
     :return ks_drift: bool, detection of significant difference across the distributions 
@@ -176,30 +201,38 @@ def calculate_ks(distibution_1, distibution_2):
     ks_drift = p_value < 0.05
 
     # Generate plots
-    plot_distribution(base, comp)
-    label = f"KS Stat suggests model drift: {ks_drift} \n P-value = {p_value}"
-    plt.title(label, loc="center")
+    if plot:
+        plot_distribution(base, comp)
+        label = f"KS Stat suggests model drift: {ks_drift} \n P-value = {p_value}"
+        plt.title(label, loc="center")
     return p_value, ks_drift
 
-def calculate_probability_vector(distibution_1, distibution_2):
+def calculate_probability_vector(distibution_1, distibution_2, bins=20, return_edges=False):
     """
     Helper function that turns raw values into a probability vector 
+    Also takes many pairs at once, as 2D arrays with one distribution per row or as lists of arrays, and
+    histograms all of them together with NumPy reductions (see `probability_vectors` in ../Includes/Drift-Monitor)
 
-    :param distribution_1: rv_continuous
-    :param distribution_2: rv_continuous 
+    :param distribution_1: rv_continuous, or 2D array / list of arrays for many pairs
+    :param distribution_2: rv_continuous, or 2D array / list of arrays for many pairs
+    :param bins: integer, number of bins of the probability vectors
+    :param return_edges: bool, also return the bin edges, e.g. to plot the vectors with `plot_binned_distribution`
 
-    :return p: array, probability vector of distribution_1
-    :return q: array, probability vector of distribution_2
+    :return p: array, probability vector of distribution_1, (n_pairs, bins) for many pairs
+    :return q: array, probability vector of distribution_2, (n_pairs, bins) for many pairs
+    :return edges: array, bin edges of the vectors, (n_pairs, bins + 1) for many pairs, only with return_edges=True
     """
-    global_min = min(min(distibution_1), min(distibution_2))
-    global_max = max(max(distibution_1), max(distibution_2))
-    
-    p = np.histogram(distibution_1, bins=20, range=(global_min, global_max))
-    q = np.histogram(distibution_2, bins=20, range=(global_min, global_max))
-    
-    return p[0], q[0]
+    # Many pairs come as a list of arrays or a 2D array; a single pair can be any 1D array-like, e.g. a Series
+    if isinstance(distibution_1, (list, tuple)):
+        many_pairs = len(distibution_1) > 0 and np.ndim(distibution_1[0]) > 0
+    else:
+        many_pairs = np.ndim(distibution_1) == 2
+    if not many_pairs:
+        vectors = probability_vectors([distibution_1], [distibution_2], bins=bins, return_edges=return_edges)
+        return tuple(vector[0] for vector in vectors)
+    return probability_vectors(distibution_1, distibution_2, bins=bins, return_edges=return_edges)
     
-def calculate_js_distance(p, q, raw_distribution_1, raw_distribution_2, threshold=0.2):
+def calculate_js_distance(p, q, raw_distribution_1, raw_distribution_2, threshold=0.2, plot=True, edges=None):
     """
     Helper function that calculated the JS distance and plots the two distributions used in the calculation 
 
@@ -208,6 +241,8 @@ def calculate_js_distance(p, q, raw_distribution_1, raw_distribution_2, threshol
     :param raw_distribution_1: array, raw values used in plotting
     :param raw_distribution_2: array, raw values used in plotting
     :param threshold: float, cutoff threshold for the JS statistic
+    :param plot: bool, set to False to skip the plot, e.g. in automated jobs
+    :param edges: array, bin edges of p and q; when given, the plot is drawn from p and q instead of the raw values
 
     :return js_stat: float, resulting distance measure from JS calculation
     :return js_drift: bool, detection of significant difference across the distributions 
@@ -217,12 +252,32 @@ def calculate_js_distance(p, q, raw_distribution_1, raw_distribution_2, threshol
     js_drift = js_stat > threshold
 
     # Generate plot
-    plot_distribution(raw_distribution_1, raw_distribution_2)
-    label = f"Jensen Shannon suggests model drift: {js_drift} \n JS Distance = {js_stat_rounded}"
-    plt.title(label, loc="center")
+    if plot and edges is not None:
+        plot_binned_distribution(p, q, edges)
+    if plot and edges is None:
+        plot_distribution(raw_distribution_1, raw_distribution_2)
+    if plot:
+        label = f"Jensen Shannon suggests model drift: {js_drift} \n JS Distance = {js_stat_rounded}"
+        plt.title(label, loc="center")
 
     return js_stat, js_drift
 
+def plot_flagged(results, distributions_1, distributions_2):
+    """
+    Lazily plots the pairs flagged as drifted by `ks_batch` or `js_batch`, one figure each time the generator advances
+
+    :param results: structured array, results of ks_batch or js_batch
+    :param distributions_1: list of arrays, first distribution of each pair
+    :param distributions_2: list of arrays, second distribution of each pair
+
+    :return: generator of (index, figure) for each flagged pair
+    """
+    for i in np.flatnonzero(results["drift"]):
+        figure = plt.figure()
+        plot_distribution(distributions_1[i], distributions_2[i])
+        plt.title(f"Pair {i} suggests model drift", loc="center")
+        yield i, figure
+
 # COMMAND ----------
 
 # MAGIC %md 
@@ -322,16 +377,16 @@ calculate_js_distance(p, q, raw_distribution_1, raw_distribution_2, threshold=0.
 # COMMAND ----------
 
 # MAGIC %md 
-# MAGIC And lastly, **`N = 100,000`**
+# MAGIC And lastly, **`N = 100,000`**. At this size the KDE plots of the raw values take much longer than the JS distance itself, so we keep the bin edges and plot the densities from the histograms the JS distance already used.
 
 # COMMAND ----------
 
 raw_distribution_1 = get_truncated_normal(upp=.80, n_size=100000)
 raw_distribution_2 = get_truncated_normal(upp=.79, n_size=100000)
 
-p, q = calculate_probability_vector(raw_distribution_1, raw_distribution_2)
+p, q, edges = calculate_probability_vector(raw_distribution_1, raw_distribution_2, return_edges=True)
 
-calculate_js_distance(p, q, raw_distribution_1, raw_distribution_2, threshold=0.2) 
+calculate_js_distance(p, q, raw_distribution_1, raw_distribution_2, threshold=0.2, edges=edges) 
 
 # COMMAND ----------
 
@@ -340,6 +395,46 @@ calculate_js_distance(p, q, raw_distribution_1, raw_distribution_2, threshold=0.
 
 # COMMAND ----------
 
+# MAGIC %md **`calculate_probability_vector`** also takes many pairs at once. Here all three sample sizes are histogrammed together and their JS distances computed in one array operation.
+
+# COMMAND ----------
+
+n_sizes = [1000, 10000, 100000]
+p, q = calculate_probability_vector([get_truncated_normal(upp=.80, n_size=n) for n in n_sizes],
+                                    [get_truncated_normal(upp=.79, n_size=n) for n in n_sizes])
+
+pd.DataFrame({"js_stat": js_distances(p, q, base=2)}, index=n_sizes)
+
+# COMMAND ----------
+
+# MAGIC %md In an automated job the KDE plots cost far more than the statistics. **`ks_batch`** and **`js_batch`** test many pairs without plotting and return a structured array of statistics and drift flags. **`plot_flagged`** then plots only the flagged pairs, one at a time as you iterate over it.
+
+# COMMAND ----------
+
+distributions_1 = [get_truncated_normal(upp=.80, n_size=n) for n in n_sizes]
+distributions_2 = [get_truncated_normal(upp=.79, n_size=n) for n in n_sizes]
+
+ks_results = ks_batch(distributions_1, distributions_2)
+js_results = js_batch(distributions_1, distributions_2, threshold=0.2)
+display(pd.DataFrame(ks_results, index=n_sizes).join(pd.DataFrame(js_results, index=n_sizes), rsuffix="_js"))
+
+# COMMAND ----------
+
+for i, figure in plot_flagged(ks_results, distributions_1, distributions_2):
+    plt.show()
+
+# COMMAND ----------
+
+# MAGIC %md A fixed JS threshold such as 0.2 ignores the sample size, even though the JS distance between two samples of the *same* distribution shrinks as they grow. The null distance also depends on how many bins the feature occupies: a discrete feature such as **`accommodates`** leaves most of its 20 bins empty, so its distances stay smaller than a continuous feature's. A **`ThresholdTable`** simulates that null distribution once over a grid of sample sizes and numbers of occupied bins and caches it on disk. Pass it to **`Monitor`** as **`thresholds`** to flag each feature against the 1 - alpha quantile for its own sample sizes and the bins its reference histogram occupies.
+
+# COMMAND ----------
+
+threshold_table = ThresholdTable.cached(f"{working_dir.replace('dbfs:', '/dbfs')}/js_thresholds.npz")
+
+pd.DataFrame({"js_threshold": threshold_table.js_threshold(n_sizes, n_sizes, 20, level=0.95)}, index=n_sizes)
+
+# COMMAND ----------
+
 # MAGIC %md In practice, you would have data over a period of time, divide it into groups based on time (e.g. weekly windows), and then run the tests on the two groups to determine if there was a statistically significant change. The frequency of these monitoring jobs depends on the training window, inference data sample size, and use case. We'll simulate this with our dataset. 
 
 # COMMAND ----------
@@ -505,113 +600,11 @@ for feature in cat_cols:
 # MAGIC %md ## Combine into One Class
 # MAGIC 
 # MAGIC Here, we'll combine the tests and code we have seen so far into a class **`Monitor`** that shows how you might implement the code above in practice. 
+# MAGIC 
+# MAGIC The class lives in **`../Includes/Drift-Monitor`**, which we ran at the top of the lesson, so the lab and the pipeline example can reuse it. Rather than looping over the numeric columns, it histograms all of them together over their shared ranges and computes every JS distance in one array operation.
 
 # COMMAND ----------
 
-import pandas as pd
-import seaborn as sns
-from scipy import stats
-import numpy as np 
-from scipy.spatial import distance
-
-class Monitor():
-  
-    def __init__(self, pdf1, pdf2, cat_cols, num_cols, alpha=.05, js_stat_threshold=0.2):
-        """
-        Pass in two pandas dataframes with the same columns for two time windows
-        List the categorical and numeric columns, and optionally provide an alpha level
-        """
-        assert (pdf1.columns == pdf2.columns).all(), "Columns do not match"
-        self.pdf1 = pdf1
-        self.pdf2 = pdf2
-        self.categorical_columns = cat_cols
-        self.continuous_columns = num_cols
-        self.alpha = alpha
-        self.js_stat_threshold = js_stat_threshold
-    
-    def run(self):
-        """
-        Call to run drift monitoring
-        """
-        self.handle_numeric_js()
-        self.handle_categorical()
-        
-        pdf1_nulls = self.pdf1.isnull().sum().sum()
-        pdf2_nulls = self.pdf2.isnull().sum().sum()
-        print(f"{pdf1_nulls} total null values found in pdf1 and {pdf2_nulls} in pdf2")
-        
-  
-    def handle_numeric_ks(self):
-        """
-        Handle the numeric features with the Two-Sample Kolmogorov-Smirnov (KS) Test with Bonferroni Correction 
-        """
-        corrected_alpha = self.alpha / len(self.continuous_columns)
-
-        for num in self.continuous_columns:
-            ks_stat, ks_pval = stats.ks_2samp(self.pdf1[num], self.pdf2[num], mode="asymp")
-            if ks_pval <= corrected_alpha:
-                self.on_drift(num)
-                
-    def handle_numeric_js(self):
-        """
-        Handles the numeric features with the Jensen Shannon (JS) test using the threshold attribute
-        """
-        for num in self.continuous_columns:
-            # Run test comparing old and new for that attribute
-            range_min = min(self.pdf1[num].min(), self.pdf2[num].min())
-            range_max = max(self.pdf1[num].max(), self.pdf2[num].max())
-            base = np.histogram(self.pdf1[num], bins=20, range=(range_min, range_max))
-            comp = np.histogram(self.pdf2[num], bins=20, range=(range_min, range_max))
-            js_stat = distance.jensenshannon(base[0], comp[0], base=2)
-            if js_stat >= self.js_stat_threshold:
-                self.on_drift(num)
-      
-    def handle_categorical(self):
-        """
-        Handle the Categorical features with Two-Way Chi-Squared Test with Bonferroni Correction
-        Note: null counts can skew the results of the Chi-Squared Test so they're currently dropped
-            by `.value_counts()`
-        """
-        corrected_alpha = self.alpha / len(self.categorical_columns)
-
-        for feature in self.categorical_columns:
-            pdf_count1 = pd.DataFrame(self.pdf1[feature].value_counts()).sort_index().rename(columns={feature:"pdf1"})
-            pdf_count2 = pd.DataFrame(self.pdf2[feature].value_counts()).sort_index().rename(columns={feature:"pdf2"})
-            pdf_counts = pdf_count1.join(pdf_count2, how="outer")#.fillna(0)
-            obs = np.array([pdf_counts["pdf1"], pdf_counts["pdf2"]])
-            _, p, _, _ = stats.chi2_contingency(obs)
-            if p < corrected_alpha:
-                self.on_drift(feature)
-
-    def generate_null_counts(self, palette="#2ecc71"):
-        """
-        Generate the visualization of percent null counts of all features
-        Optionally provide a color palette for the visual
-        """
-        cm = sns.light_palette(palette, as_cmap=True)
-        return pd.concat([100 * self.pdf1.isnull().sum() / len(self.pdf1), 
-                          100 * self.pdf2.isnull().sum() / len(self.pdf2)], axis=1, 
-                          keys=["pdf1", "pdf2"]).style.background_gradient(cmap=cm, text_color_threshold=0.5, axis=1)
-    
-    def generate_percent_change(self, palette="#2ecc71"):
-        """
-        Generate visualization of percent change in summary statistics of numeric features
-        Optionally provide a color palette for the visual
-        """
-        cm = sns.light_palette(palette, as_cmap=True)
-        summary1_pdf = self.pdf1.describe()[self.continuous_columns]
-        summary2_pdf = self.pdf2.describe()[self.continuous_columns]
-        percent_change = 100 * abs((summary1_pdf - summary2_pdf) / (summary1_pdf + 1e-100))
-        return percent_change.style.background_gradient(cmap=cm, text_color_threshold=0.5, axis=1)
-  
-    def on_drift(self, feature):
-        """
-        Complete this method with your response to drift.  Options include:
-          - raise an alert
-          - automatically retrain model
-        """
-        print(f"Drift found in {feature}!")
-    
 drift_monitor = Monitor(pdf1, pdf2, cat_cols, num_cols)
 drift_monitor.run()
 
@@ -625,6 +618,118 @@ drift_monitor.generate_null_counts()
 
 # COMMAND ----------
 
+# MAGIC %md **`run`** returns a **`DriftReport`**. Its **`results`** hold the statistic, p-value, threshold and drift flag of every feature, and its **`timings`** show where the time went. **`on_drift`** runs inline while the features are tested, so a real response there, such as an alert or a retrain trigger, would hold up the scan. Register those with **`add_drift_handler`** instead: each handler runs on a background thread fed by a bounded queue, and you can register several. **`wait_for_handlers`** blocks until the queued drifts are handled, and **`close_handlers`** also stops the threads.
+
+# COMMAND ----------
+
+import time
+
+alerts = []
+
+def send_alert(feature, details):
+    # Stand-in for a slow alert sink, e.g. a webhook or a ticketing system
+    time.sleep(1)
+    alerts.append(f"{feature}: {details['metric']} = {details['statistic']:.3f}")
+
+alert_monitor = Monitor(pdf1, pdf2, cat_cols, num_cols)
+alert_monitor.add_drift_handler(send_alert)
+report = alert_monitor.run()
+print(f"Report ready after {report.timings['total']:.2f} seconds, drift found in {report.drifted}")
+
+alert_monitor.close_handlers()
+alerts
+
+# COMMAND ----------
+
+# MAGIC %md In production the baseline window is usually the same training window every day. Rather than reloading it for every comparison, summarize it once into a **`ReferenceProfile`** (bin edges, histograms, a quantile sketch, category counts and null counts), save it, and pass it to **`Monitor`** in place of **`pdf1`**.
+
+# COMMAND ----------
+
+profile_path = f"{working_dir.replace('dbfs:', '/dbfs')}/reference_profile.npz"
+ReferenceProfile.from_pandas(pdf1, cat_cols, num_cols).save(profile_path)
+
+profile_monitor = Monitor(ReferenceProfile.load(profile_path), pdf2, cat_cols, num_cols)
+profile_monitor.run()
+
+# COMMAND ----------
+
+# MAGIC %md Every test so far looks at one feature at a time, so it can't see a change in how features move together. Below, **`price`** is shuffled across the listings of the second half: its distribution is unchanged, but it no longer follows **`accommodates`** or **`bedrooms`**. The JS test finds nothing, while **`handle_multivariate`** compares the joint distribution of the columns with a Maximum Mean Discrepancy (MMD) permutation test. The test uses random Fourier features, so it runs in linear time over millions of rows.
+
+# COMMAND ----------
+
+joint_pdf = airbnb_pdf.drop(pdf1.index)
+joint_pdf["price"] = joint_pdf["price"].sample(frac=1, random_state=1).to_numpy()
+
+joint_monitor = Monitor(pdf1, joint_pdf, cat_cols, num_cols)
+joint_monitor.handle_numeric_js()
+joint_monitor.handle_multivariate(["accommodates", "bedrooms", "price"])
+
+# COMMAND ----------
+
+# MAGIC %md By default **`run`** uses JS for the numeric features and the Chi-Squared test for the categorical ones. Pass **`metrics`** to choose from the registered drift metrics instead: **`js`**, **`psi`**, **`hellinger`**, **`wasserstein`**, **`ks`** and **`chi2`**. Each metric declares the statistic it needs (raw values, histograms, quantile sketches or category counts); **`ks`** runs exactly on the raw values when both windows are in memory and on quantile sketches otherwise. Each statistic is computed only once, however many metrics use it. You can add your own metrics with **`register_metric`**.
+
+# COMMAND ----------
+
+metrics_monitor = Monitor(pdf1, pdf2, cat_cols, num_cols, metrics=["js", "psi", "hellinger", "wasserstein", "ks", "chi2"])
+metrics_report = metrics_monitor.run()
+display(metrics_report.results.reset_index())
+
+# COMMAND ----------
+
+# MAGIC %md Every monitor above starts from pandas DataFrames, so both windows have to fit in memory. For larger windows, **`ParquetMonitor`** takes the paths of Parquet files or directories. It streams them row group by row group and reads only the monitored columns. Each batch is folded into a bounded-size sketch, so memory depends on the batch size rather than on the window size.
+
+# COMMAND ----------
+
+parquet_dir = f"{working_dir.replace('dbfs:', '/dbfs')}/monitoring_windows"
+dbutils.fs.mkdirs(parquet_dir.replace("/dbfs", "dbfs:"))
+pdf1.to_parquet(f"{parquet_dir}/window1.parquet")
+pdf2.to_parquet(f"{parquet_dir}/window2.parquet")
+
+parquet_monitor = ParquetMonitor(f"{parquet_dir}/window1.parquet", f"{parquet_dir}/window2.parquet", cat_cols, num_cols)
+parquet_monitor.run()
+
+# COMMAND ----------
+
+# MAGIC %md To try it on windows split into several files, generate them with **`SyntheticData`** from ../Includes/Synthetic-Data. It writes each window as Parquet shards chunk by chunk, and the same seed always gives the same rows, so the same code writes windows of any size with bounded memory. We keep them small here so the cell runs in seconds. Here the second window's **`price`** comes from a truncated normal with a lower upper bound, as in the demos above.
+
+# COMMAND ----------
+
+synthetic_columns = {"neighbourhood_cleansed": Categorical(["Mission", "SoMa", "Nob Hill"], [0.5, 0.3, 0.2]),
+                     "accommodates": Uniform(1, 8)}
+window1 = SyntheticData({**synthetic_columns, "price": TruncatedNormal(upp=.80)}, seed=1)
+window2 = SyntheticData({**synthetic_columns, "price": TruncatedNormal(upp=.79)}, seed=2)
+window1.write_parquet(f"{parquet_dir}/synthetic_window1", 300000, rows_per_shard=100000)
+window2.write_parquet(f"{parquet_dir}/synthetic_window2", 300000, rows_per_shard=100000)
+
+synthetic_monitor = ParquetMonitor(f"{parquet_dir}/synthetic_window1", f"{parquet_dir}/synthetic_window2",
+                                   ["neighbourhood_cleansed"], ["accommodates", "price"])
+synthetic_monitor.run()
+
+# COMMAND ----------
+
+# MAGIC %md When a window does fit in memory, **`Monitor`** also accepts Arrow tables, e.g. from **`pyarrow.parquet.read_table`**, which is faster than converting them to pandas. The numeric tests run on zero-copy NumPy views of the Arrow buffers, and the categorical features are counted from their dictionary encodings, so no string is ever turned into a Python object.
+
+# COMMAND ----------
+
+import pyarrow.parquet as pq
+
+arrow_monitor = Monitor(pq.read_table(f"{parquet_dir}/window1.parquet", columns=num_cols + cat_cols),
+                        pq.read_table(f"{parquet_dir}/window2.parquet", columns=num_cols + cat_cols), cat_cols, num_cols)
+arrow_monitor.run()
+
+# COMMAND ----------
+
+# MAGIC %md When new data arrives in micro-batches, you don't have to wait for the whole window before testing it. **`SequentialMonitor`** keeps running bin counts of every feature and updates its tests after each batch with **`update`**. Its tests are always valid: checking them after every batch does not raise the false-positive rate. A feature stops being read once drift is found, or once its distance to the baseline is shown to be below **`tolerance`**. The **`n`** column shows how many values each feature needed before it was decided.
+
+# COMMAND ----------
+
+sequential_monitor = SequentialMonitor(pdf1, cat_cols, num_cols, tolerance=0.2)
+for start in range(0, len(pdf2), 250):
+    sequential_monitor.update(pdf2.iloc[start:start + 250])
+sequential_monitor.run()
+
+# COMMAND ----------
+
 # MAGIC %md ## Drift Monitoring Architecture
 # MAGIC 
 # MAGIC A potential workflow for deployment and dirft monitoring could look something like this:
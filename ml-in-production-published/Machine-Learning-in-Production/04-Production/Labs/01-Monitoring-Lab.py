@@ -69,110 +69,7 @@ df2.head()
 
 # COMMAND ----------
 
-import pandas as pd
-import seaborn as sns
-from scipy import stats
-import numpy as np 
-from scipy.spatial import distance
-
-class Monitor():
-  
-    def __init__(self, pdf1, pdf2, cat_cols, num_cols, alpha=.05, js_stat_threshold=0.2):
-        """
-        Pass in two pandas dataframes with the same columns for two time windows
-        List the categorical and numeric columns, and optionally provide an alpha level
-        """
-        assert (pdf1.columns == pdf2.columns).all(), "Columns do not match"
-        self.pdf1 = pdf1
-        self.pdf2 = pdf2
-        self.categorical_columns = cat_cols
-        self.continuous_columns = num_cols
-        self.alpha = alpha
-        self.js_stat_threshold = js_stat_threshold
-    
-    def run(self):
-        """
-        Call to run drift monitoring
-        """
-        self.handle_numeric_js()
-        self.handle_categorical()
-        
-        pdf1_nulls = self.pdf1.isnull().sum().sum()
-        pdf2_nulls = self.pdf2.isnull().sum().sum()
-        print(f"{pdf1_nulls} total null values found in pdf1 and {pdf2_nulls} in pdf2")
-        
-  
-    def handle_numeric_ks(self):
-        """
-        Handle the numeric features with the Two-Sample Kolmogorov-Smirnov (KS) Test with Bonferroni Correction 
-        """
-        corrected_alpha = self.alpha / len(self.continuous_columns)
-
-        for num in self.continuous_columns:
-            ks_stat, ks_pval = stats.ks_2samp(self.pdf1[num], self.pdf2[num], mode="asymp")
-            if ks_pval <= corrected_alpha:
-                self.on_drift(num)
-                
-    def handle_numeric_js(self):
-        """
-        Handles the numeric features with the Jensen Shannon (JS) test using the threshold attribute
-        """
-        for num in self.continuous_columns:
-            # Run test comparing old and new for that attribute
-            range_min = min(self.pdf1[num].min(), self.pdf2[num].min())
-            range_max = max(self.pdf1[num].max(), self.pdf2[num].max())
-            base = np.histogram(self.pdf1[num], bins=20, range=(range_min, range_max))
-            comp = np.histogram(self.pdf2[num], bins=20, range=(range_min, range_max))
-            js_stat = distance.jensenshannon(base[0], comp[0], base=2)
-            if js_stat >= self.js_stat_threshold:
-                self.on_drift(num)
-      
-    def handle_categorical(self):
-        """
-        Handle the Categorical features with Two-Way Chi-Squared Test with Bonferroni Correction
-        Note: null counts can skew the results of the Chi-Squared Test so they're currently dropped
-            by `.value_counts()`
-        """
-        corrected_alpha = self.alpha / len(self.categorical_columns)
-
-        for feature in self.categorical_columns:
-            pdf_count1 = pd.DataFrame(self.pdf1[feature].value_counts()).sort_index().rename(columns={feature:"pdf1"})
-            pdf_count2 = pd.DataFrame(self.pdf2[feature].value_counts()).sort_index().rename(columns={feature:"pdf2"})
-            pdf_counts = pdf_count1.join(pdf_count2, how="outer")#.fillna(0)
-            obs = np.array([pdf_counts["pdf1"], pdf_counts["pdf2"]])
-            _, p, _, _ = stats.chi2_contingency(obs)
-            if p < corrected_alpha:
-                self.on_drift(feature)
-
-    def generate_null_counts(self, palette="#2ecc71"):
-        """
-        Generate the visualization of percent null counts of all features
-        Optionally provide a color palette for the visual
-        """
-        cm = sns.light_palette(palette, as_cmap=True)
-        return pd.concat([100 * self.pdf1.isnull().sum() / len(self.pdf1), 
-                          100 * self.pdf2.isnull().sum() / len(self.pdf2)], axis=1, 
-                          keys=["pdf1", "pdf2"]).style.background_gradient(cmap=cm, text_color_threshold=0.5, axis=1)
-    
-    def generate_percent_change(self, palette="#2ecc71"):
-        """
-        Generate visualization of percent change in summary statistics of numeric features
-        Optionally provide a color palette for the visual
-        """
-        cm = sns.light_palette(palette, as_cmap=True)
-        summary1_pdf = self.pdf1.describe()[self.continuous_columns]
-        summary2_pdf = self.pdf2.describe()[self.continuous_columns]
-        percent_change = 100 * abs((summary1_pdf - summary2_pdf) / (summary1_pdf + 1e-100))
-        return percent_change.style.background_gradient(cmap=cm, text_color_threshold=0.5, axis=1)
-  
-    def on_drift(self, feature):
-        """
-        Complete this method with your response to drift.  Options include:
-          - raise an alert
-          - automatically retrain model
-        """
-        print(f"Drift found in {feature}!")
-
+# MAGIC %run "../../Includes/Drift-Monitor"
 
 # COMMAND ----------
 
@@ -0,0 +1,116 @@
+# Databricks notebook source
+# Dependencies for Class SyntheticData
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy.special import ndtr, ndtri
+
+# COMMAND ----------
+
+# Column distributions; each one turns uniform draws into values so a column's stream does not depend on chunking
+class TruncatedNormal():
+
+    def __init__(self, mean=0, sd=1, low=0.2, upp=0.8):
+        """
+        Normal distribution truncated to [low, upp], with the same parameters as `get_truncated_normal`
+        """
+        self.mean = mean
+        self.sd = sd
+        self.cdf_low = ndtr((low - mean) / sd)
+        self.cdf_upp = ndtr((upp - mean) / sd)
+
+    def from_uniform(self, u):
+        # Inverse CDF of the truncated normal
+        return self.mean + self.sd * ndtri(self.cdf_low + u * (self.cdf_upp - self.cdf_low))
+
+class Uniform():
+
+    def __init__(self, low=0, high=1):
+        """
+        Uniform distribution over [low, high)
+        """
+        self.low = low
+        self.high = high
+
+    def from_uniform(self, u):
+        return self.low + u * (self.high - self.low)
+
+class Categorical():
+
+    def __init__(self, categories, probabilities=None):
+        """
+        Categorical distribution over the given categories, uniform unless probabilities are given
+        """
+        self.categories = list(categories)
+        probabilities = np.ones(len(self.categories)) if probabilities is None else np.asarray(probabilities, dtype=float)
+        self.cumulative = np.cumsum(probabilities / probabilities.sum())
+
+    def from_uniform(self, u):
+        codes = np.minimum(np.searchsorted(self.cumulative, u, side="right"), len(self.categories) - 1)
+        return pd.Categorical.from_codes(codes, categories=self.categories)
+
+# COMMAND ----------
+
+class SyntheticData():
+
+    def __init__(self, columns, seed=0, chunk_size=1000000):
+        """
+        Pass in a dict of column name to distribution (TruncatedNormal, Uniform or Categorical) and a seed
+        Rows are generated in shards of chunk_size-row pandas dataframes, so memory stays bounded whatever the size
+        Every column of every shard draws from its own np.random.SeedSequence child, so the data only depends on
+        the seed and the shard size, not on the chunk size or on how many workers generate the shards
+        """
+        self.columns = dict(columns)
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    def shard(self, shard, n_rows):
+        """
+        Generator of the pandas dataframe chunks of one shard of n_rows rows
+        """
+        generators = [np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(shard, i)))
+                      for i in range(len(self.columns))]
+        for start in range(0, n_rows, self.chunk_size):
+            size = min(self.chunk_size, n_rows - start)
+            yield pd.DataFrame({name: distribution.from_uniform(generator.random(size))
+                                for (name, distribution), generator in zip(self.columns.items(), generators)})
+
+    def to_pandas(self, n_rows):
+        """
+        All n_rows rows as one pandas dataframe, i.e. the single shard 0; use it for samples that fit in memory
+        """
+        return pd.concat(self.shard(0, n_rows), ignore_index=True)
+
+    def write_parquet(self, path, n_rows, rows_per_shard=10000000, executor=None):
+        """
+        Writes n_rows rows as Parquet shards of rows_per_shard rows under the local directory path (e.g. /dbfs/...)
+        Each chunk becomes a row group of its shard's file. Optionally provide a thread or process pool executor
+        to write the shards in parallel; the files are the same either way
+        Returns the paths of the shard files
+        """
+        os.makedirs(path, exist_ok=True)
+        shards = [(shard, min(rows_per_shard, n_rows - start))
+                  for shard, start in enumerate(range(0, n_rows, rows_per_shard))]
+        paths = [os.path.join(path, f"part-{shard:05d}.parquet") for shard, _ in shards]
+
+        tasks = [(self, file_path, shard, shard_rows) for file_path, (shard, shard_rows) in zip(paths, shards)]
+        if executor is None:
+            for task in tasks:
+                _write_shard(*task)
+        else:
+            list(executor.map(_write_shard, *zip(*tasks)))
+        return paths
+
+def _write_shard(data, file_path, shard, n_rows):
+    writer = None
+    try:
+        for chunk in data.shard(shard, n_rows):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(file_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
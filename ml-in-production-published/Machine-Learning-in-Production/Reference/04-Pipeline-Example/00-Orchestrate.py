@@ -139,16 +139,20 @@ store_scored_path = f"{working_dir}/driftexample/scored_data"
 dbutils.fs.rm(store_scored_path, True)
 dbutils.fs.mkdirs(store_scored_path)
 
+prediction_summary_path = f"{working_dir}/driftexample/prediction_summary.npz"
+
 params = {
     "file_path": data_featurized_path,
     "save_path": store_scored_path, 
-    "registry_model_name": registry_model_name  
+    "registry_model_name": registry_model_name,
+    "summary_path": prediction_summary_path,
+    "label_col": "price"
 }
 dbutils.notebook.run("./05-Score", 0, params)
 
 # COMMAND ----------
 
-# MAGIC %md Now we can see our scored featurized dataset with predictions!
+# MAGIC %md Now we can see our scored featurized dataset with predictions! The Score notebook also saved a summary of the predictions and residuals to **`prediction_summary_path`**, which Drift Monitor uses as the baseline for the model outputs.
 
 # COMMAND ----------
 
@@ -156,6 +160,40 @@ display(spark.read.format("delta").load(store_scored_path))
 
 # COMMAND ----------
 
+# MAGIC %md When the second time period of data arrives, it is featurized and scored with the production model the same way. Its summary is binned over the edges of the first window's summary, so Drift Monitor can compare the two.
+
+# COMMAND ----------
+
+data_featurized_path_2 = f"{working_dir}/driftexample/data_featurized_2"
+dbutils.fs.rm(data_featurized_path_2, True)
+dbutils.fs.mkdirs(data_featurized_path_2)
+
+params = {
+    "file_path": data_path2, 
+    "save_path": data_featurized_path_2
+}
+dbutils.notebook.run("./02-Featurize", 0, params)
+
+# COMMAND ----------
+
+store_scored_path_2 = f"{working_dir}/driftexample/scored_data_2"
+dbutils.fs.rm(store_scored_path_2, True)
+dbutils.fs.mkdirs(store_scored_path_2)
+
+prediction_summary_path_2 = f"{working_dir}/driftexample/prediction_summary_2.npz"
+
+params = {
+    "file_path": data_featurized_path_2,
+    "save_path": store_scored_path_2, 
+    "registry_model_name": registry_model_name,
+    "summary_path": prediction_summary_path_2,
+    "reference_summary_path": prediction_summary_path,
+    "label_col": "price"
+}
+dbutils.notebook.run("./05-Score", 0, params)
+
+# COMMAND ----------
+
 # MAGIC %md ### Drift Monitor
 # MAGIC 
 # MAGIC Now that we have a current production model in the model registry, we would be concerned about the model going stale over time. We will have to be careful to monitor for drift in future datasets. 
@@ -171,7 +209,9 @@ drift_path = f"{working_dir}/driftexample/data_featurized_drift"
 params = {
     "file_path_1": data_featurized_path, 
     "file_path_2": data_path2,
-    "drift_path": drift_path
+    "drift_path": drift_path,
+    "summary_path_1": prediction_summary_path,
+    "summary_path_2": prediction_summary_path_2
 }
 dbutils.notebook.run("./06-Monitor", 0, params)
 
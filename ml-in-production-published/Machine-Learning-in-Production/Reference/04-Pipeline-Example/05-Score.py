@@ -2,6 +2,8 @@
 # MAGIC %md ### Score
 # MAGIC 
 # MAGIC This notebook is called from Orchestrate to score a new dataset with the current production model's predictions, and then store it in the given path. 
+# MAGIC 
+# MAGIC Given a **`summary_path`**, it also writes a small summary of the model outputs as a side output: histograms and quantile sketches of the predictions and, when the labels are in the data, of the residuals and absolute errors. Drift Monitor compares these summaries instead of reading the scored data again.
 
 # COMMAND ----------
 
@@ -18,10 +20,16 @@ from mlflow.tracking import MlflowClient
 dbutils.widgets.text("save_path", "Default")
 dbutils.widgets.text("file_path", "Default")
 dbutils.widgets.text("registry_model_name", "Default")
+dbutils.widgets.text("summary_path", "")
+dbutils.widgets.text("reference_summary_path", "")
+dbutils.widgets.text("label_col", "")
 
 file_path = dbutils.widgets.get("file_path")
 save_path = dbutils.widgets.get("save_path")
 registry_model_name = dbutils.widgets.get("registry_model_name")
+summary_path = dbutils.widgets.get("summary_path")
+reference_summary_path = dbutils.widgets.get("reference_summary_path")
+label_col = dbutils.widgets.get("label_col")
 
 # COMMAND ----------
 
@@ -38,13 +46,36 @@ data_to_score = spark.read.format("delta").load(file_path)
 # COMMAND ----------
 
 # MAGIC %md Finally, let's save the predictions to a new column and store the new dataframe in the new store path.
+# MAGIC 
+# MAGIC The scored dataframe is cached, so the summary below reads the predictions from memory instead of scoring the data again or reading back the table we just wrote.
 
 # COMMAND ----------
 
-scored_df = model.transform(data_to_score)
+scored_df = model.transform(data_to_score).cache()
 display(scored_df)
 
 # COMMAND ----------
 
 scored_df.write.format("delta").mode("overwrite").save(save_path)
 
+# COMMAND ----------
+
+# MAGIC %md Now let's summarize the model outputs with **`prediction_sketch`** from the Monitor include. If a reference summary is given, e.g. from the window the model was trained on, we reuse its bin edges so the two summaries can be compared; both summaries must be built with the same **`label_col`**.
+# MAGIC 
+# MAGIC When the labels only arrive later, join them to the scored rows once they land and run **`prediction_sketch`** again with **`label_col`** set, to get the residual and error summaries of the window.
+
+# COMMAND ----------
+
+# MAGIC %run "../../Includes/Drift-Monitor"
+
+# COMMAND ----------
+
+if summary_path:
+    label = label_col if label_col in scored_df.columns else None
+    reference = None
+    if reference_summary_path:
+        reference = WindowSketch.load(reference_summary_path.replace("dbfs:", "/dbfs"))
+    prediction_sketch(scored_df, label_col=label, reference=reference).save(summary_path.replace("dbfs:", "/dbfs"))
+
+scored_df.unpersist()
+
@@ -12,10 +12,14 @@
 dbutils.widgets.text("file_path_1", "Default")
 dbutils.widgets.text("file_path_2", "Default")
 dbutils.widgets.text("drift_path", "Default")
+dbutils.widgets.text("summary_path_1", "")
+dbutils.widgets.text("summary_path_2", "")
 
 file_path_1 = dbutils.widgets.get("file_path_1")
 file_path_2 = dbutils.widgets.get("file_path_2")
 drift_path = dbutils.widgets.get("drift_path")
+summary_path_1 = dbutils.widgets.get("summary_path_1")
+summary_path_2 = dbutils.widgets.get("summary_path_2")
 
 # COMMAND ----------
 
@@ -68,91 +72,12 @@ df2_featurized = spark.read.format("delta").load(drift_path)
 # COMMAND ----------
 
 # MAGIC %md Load the Monitor class from the lesson. 
+# MAGIC 
+# MAGIC We use its Spark-backed mode, **`SparkMonitor`**, which computes the KS statistics from approximate quantiles, the JS histograms and the chi-squared contingency tables with distributed aggregations. Only the small per-column summaries are collected to the driver, rather than both time windows.
 
 # COMMAND ----------
 
-# Dependencies for Class Monitor
-import pandas as pd
-import seaborn as sns
-from scipy import stats
-import numpy as np 
-
-class Monitor():
-  
-    def __init__(self, pdf1, pdf2, categorical_cols, numeric_cols, alpha=.05):
-        """
-        Pass in two pandas dataframes with the same columns for two time windows
-        List the categorical and numeric columns, and optionally provide an alpha level
-        """
-        assert (pdf1.columns == pdf2.columns).all(), "Columns do not match"
-        self.pdf1 = pdf1
-        self.pdf2 = pdf2
-        self.alpha = alpha
-        self.categorical_cols = categorical_cols
-        self.numeric_cols = numeric_cols
-    
-    
-    def run(self):
-        """
-        Call to run drift monitoring
-        """
-        self.handle_numeric()
-        self.handle_categorical()
-  
-    def handle_numeric(self):
-        """
-        Handle the numeric features with the Two-Sample Kolmogorov-Smirnov (KS) Test with Bonferroni Correction 
-        """
-        corrected_alpha = self.alpha / len(self.numeric_cols)
-
-        for num in self.numeric_cols:
-            ks_stat, ks_pval = stats.ks_2samp(self.pdf1[num], self.pdf2[num], mode="asymp")
-            if ks_pval <= corrected_alpha:
-                self.on_drift(num)
- 
-    def handle_categorical(self):
-        """
-        Handle the Categorical features with Two-Way Chi-Squared Test with Bonferroni Correction
-        """
-        corrected_alpha = self.alpha / len(self.categorical_cols)
-
-        for feature in self.categorical_cols:
-            pdf_count1 = pd.DataFrame(self.pdf1[feature].value_counts()).sort_index().rename(columns={feature:"pdf1"})
-            pdf_count2 = pd.DataFrame(self.pdf2[feature].value_counts()).sort_index().rename(columns={feature:"pdf2"})
-            pdf_counts = pdf_count1.join(pdf_count2, how="outer").fillna(0)
-            obs = np.array([pdf_counts["pdf1"], pdf_counts["pdf2"]])
-            _, p, _, _ = stats.chi2_contingency(obs)
-            if p < corrected_alpha:
-                self.on_drift(feature)
-  
-    def generate_null_counts(self, palette="#2ecc71"):
-        """
-        Generate the visualization of percent null counts of all features
-        Optionally provide a color palette for the visual
-        """
-        cm = sns.light_palette(palette, as_cmap=True)
-        return pd.concat([100 * self.pdf1.isnull().sum() / len(self.pdf1), 
-                          100 * self.pdf2.isnull().sum() / len(self.pdf2)], axis=1, 
-                          keys=["pdf1", "pdf2"]).style.background_gradient(cmap=cm, text_color_threshold=0.5, axis=1)
-
-    def generate_percent_change(self, palette="#2ecc71"):
-        """
-        Generate visualization of percent change in summary statistics of numeric features
-        Optionally provide a color palette for the visual
-        """
-        cm = sns.light_palette(palette, as_cmap=True)
-        summary1_pdf = self.pdf1.describe()[self.numeric_cols]
-        summary2_pdf = self.pdf2.describe()[self.numeric_cols]
-        percent_change = 100 * abs((summary1_pdf - summary2_pdf) / (summary1_pdf + 1e-100))
-        return percent_change.style.background_gradient(cmap=cm, text_color_threshold=0.5, axis=1)
-    
-    def on_drift(self, feature):
-        """
-        Complete this method with your response to drift.  Options include:
-          - raise an alert
-          - automatically retrain model
-        """
-        print(f"Drift found in {feature}!")
+# MAGIC %run "../../Includes/Drift-Monitor"
 
 # COMMAND ----------
 
@@ -160,10 +85,24 @@ class Monitor():
 
 # COMMAND ----------
 
-drift_monitor = Monitor(df1_featurized.select(cols).toPandas(), df2_featurized.select(cols).toPandas(), categorical_cols, numeric_cols)
-drift_monitor.run()
+drift_monitor = SparkMonitor(df1_featurized.select(cols), df2_featurized.select(cols), categorical_cols, numeric_cols)
+drift_monitor.handle_numeric_ks()
+drift_monitor.handle_categorical()
 
 # COMMAND ----------
 
 drift_monitor.generate_percent_change()
 
+# COMMAND ----------
+
+# MAGIC %md The features are only half of the picture: we also want to know if the model's predictions and errors have drifted. 
+# MAGIC 
+# MAGIC The Score notebook wrote a summary of the predictions, residuals and absolute errors of each window alongside its scored data, binned over the same edges. **`StreamingMonitor`** takes the first window's summary as its baseline and the second one is merged in as the new window, so neither scored table is read again. The check is skipped when the summary paths are not given.
+
+# COMMAND ----------
+
+if summary_path_1 and summary_path_2:
+    reference_summary = WindowSketch.load(summary_path_1.replace("dbfs:", "/dbfs"))
+    prediction_monitor = StreamingMonitor(reference_summary, [], reference_summary.continuous_columns)
+    prediction_monitor.merge(WindowSketch.load(summary_path_2.replace("dbfs:", "/dbfs")))
+    display(prediction_monitor.run().results.reset_index())